@@ -1,4 +1,6 @@
 import json
+import math
+from functools import lru_cache
 from typing import Self
 
 import numpy as np
@@ -12,51 +14,232 @@ class ColorEncoder(json.JSONEncoder):
         return super().default(obj)
 
 
+# (r, g, b) picks out of (v, q, p, t) for each of the six hue sextants, as plain
+# tuples for the scalar path and as an index array for take_along_axis
+_SEXTANT_ORDER = ((0, 3, 2), (1, 0, 2), (2, 0, 3), (2, 1, 0), (3, 2, 0), (0, 2, 1))
+_SEXTANTS = np.array(_SEXTANT_ORDER)
+
+# linear sRGB <-> OKLab matrices (Ottosson), rgb is treated as linear like the
+# "RGB" node of colour.convert that these replace
+_RGB_TO_LMS = (
+    (0.4122214708, 0.5363325363, 0.0514459929),
+    (0.2119034982, 0.6806995451, 0.1073969566),
+    (0.0883024619, 0.2817188376, 0.6299787005),
+)
+_LMS_TO_LAB = (
+    (0.2104542553, 0.7936177850, -0.0040720468),
+    (1.9779984951, -2.4285922050, 0.4505937099),
+    (0.0259040371, 0.7827717662, -0.8086757660),
+)
+_LAB_TO_LMS = (
+    (1.0, 0.3963377774, 0.2158037573),
+    (1.0, -0.1055613458, -0.0638541728),
+    (1.0, -0.0894841775, -1.2914855480),
+)
+_LMS_TO_RGB = (
+    (4.0767416621, -3.3077115913, 0.2309699292),
+    (-1.2684380046, 2.6097574011, -0.3413193965),
+    (-0.0041960863, -0.7034186147, 1.7076147010),
+)
+
+
+def _dot(matrix, vector):
+    return tuple(sum(m * x for m, x in zip(row, vector)) for row in matrix)
+
+
+def _rgb_to_hsv(r, g, b):
+    maximum = max(r, g, b)
+    delta = maximum - min(r, g, b)
+    if delta == 0:
+        return 0.0, 0.0, maximum
+    # only the two channels besides the maximum enter the hue
+    half = delta / 2
+    if maximum == b:
+        offset, first, second = 2 / 3, g, r
+    elif maximum == g:
+        offset, first, second = 1 / 3, r, b
+    else:
+        offset, first, second = 0.0, b, g
+    h = (
+        offset
+        + ((maximum - first) / 6 + half) / delta
+        - ((maximum - second) / 6 + half) / delta
+    )
+    if h < 0:
+        h += 1
+    elif h > 1:
+        h -= 1
+    return h, delta / maximum, maximum
+
+
+def _hsv_to_rgb(h, s, v):
+    h6 = h % 1.0 * 6
+    sextant = int(h6)
+    f = h6 - sextant
+    candidates = (v, v * (1 - s * f), v * (1 - s), v * (1 - s * (1 - f)))
+    i, j, k = _SEXTANT_ORDER[sextant % 6]
+    return candidates[i], candidates[j], candidates[k]
+
+
+def _rgb_to_oklab(r, g, b):
+    lms = _dot(_RGB_TO_LMS, (r, g, b))
+    return _dot(_LMS_TO_LAB, [math.copysign(abs(x) ** (1 / 3), x) for x in lms])
+
+
+def _rgb_to_oklch(r, g, b):
+    lab = _rgb_to_oklab(r, g, b)
+    hue = math.degrees(math.atan2(lab[2], lab[1])) % 360
+    return lab[0], math.hypot(lab[1], lab[2]), hue / 360
+
+
+def _oklch_to_rgb(l, c, h):
+    angle = h * 2 * math.pi
+    lms = _dot(_LAB_TO_LMS, (l, c * math.cos(angle), c * math.sin(angle)))
+    return _dot(_LMS_TO_RGB, [x**3 for x in lms])
+
+
+# Templates and themes keep rebuilding the same handful of colors, so the
+# parsing behind from_rgb/from_hex is memoized; the triples are immutable
+@lru_cache(maxsize=4096)
+def _rgb255_to_rgb(r, g, b):
+    return float(r) / 255, float(g) / 255, float(b) / 255
+
+
+@lru_cache(maxsize=4096)
+def _hex_to_rgb(hex_color):
+    return tuple(map(float, colour.notation.HEX_to_RGB(hex_color)))
+
+
+# hue offsets and tint/shade steps behind Color.harmonies/ColorArray.harmonies
+_HUE_HARMONIES = {
+    "Complementary": (0.5,),
+    "Analogous": (-1 / 12, 1 / 12),
+    "Triadic": (1 / 3, 2 / 3),
+    "Tetradic": (0.25, 0.5, 0.75),
+}
+_HARMONY_RAMP = (0.2, 0.4, 0.6, 0.8)
+
+# color spaces reachable as attributes (color.oklch, color.hsv, ...), all from
+# the 0-1 rgb triple; results are cached per instance, any other space name goes
+# through colour.convert
+_CONVERTERS = {
+    "HSV": _rgb_to_hsv,
+    "OKLAB": _rgb_to_oklab,
+    "OKLCH": _rgb_to_oklch,
+}
+
+
 class Color:
+    # plain 0-1 floats per channel, no per-color array allocation
+    __slots__ = ("r", "g", "b", "_cache")
+
     def __init__(self, h, s, v):
-        self._rgb = np.array(colour.models.HSV_to_RGB(np.array([h, s, v], float)))
+        self.r, self.g, self.b = _hsv_to_rgb(h, s, v)
+        self._cache = {}
+
+    @classmethod
+    def _from_unit_rgb(cls, rgb):
+        obj = cls.__new__(cls)
+        obj.r, obj.g, obj.b = rgb
+        obj._cache = {}
+        return obj
+
+    @staticmethod
+    def hsv_to_rgb_batch(hsv):
+        """Convert a (..., 3) array of 0-1 HSV values to 0-1 RGB without branching."""
+        hsv = np.asarray(hsv, float)
+        h6 = hsv[..., 0] % 1.0 * 6
+        s, v = hsv[..., 1], hsv[..., 2]
+        sextant = h6.astype(int)
+        f = h6 - sextant
+        candidates = np.stack(
+            [v, v * (1 - s * f), v * (1 - s), v * (1 - s * (1 - f))], -1
+        )
+        return np.take_along_axis(candidates, _SEXTANTS[sextant % 6], -1)
+
+    @staticmethod
+    def rgb_to_hsv_batch(rgb):
+        """Convert a (..., 3) array of 0-1 RGB values to 0-1 HSV, like colorsys."""
+        rgb = np.asarray(rgb, float)
+        maximum = rgb.max(-1)
+        delta = maximum - rgb.min(-1)
+        gray = delta == 0
+        rc, gc, bc = np.moveaxis(
+            (maximum[..., None] - rgb) / np.where(gray, 1, delta)[..., None], -1, 0
+        )
+        h = np.select(
+            [rgb[..., 0] == maximum, rgb[..., 1] == maximum],
+            [bc - gc, 2 + rc - bc],
+            4 + gc - rc,
+        )
+        h = np.where(gray, 0.0, h / 6 % 1.0)
+        s = np.where(gray, 0.0, delta / np.where(maximum == 0, 1, maximum))
+        return np.stack([h, s, maximum], -1)
 
     def __str__(self):
-        return colour.notation.RGB_to_HEX(self._rgb)
+        return self.hex
 
-    # === dynamic color space access ===
+    # === color space access ===
     def __getattr__(self, name):
-        try:
-            return colour.convert(self._rgb, "RGB", name.upper())
-        except Exception:
+        space = name.upper()
+        if name.startswith("_"):
             raise AttributeError(name)
+        converter = _CONVERTERS.get(space)
+        if converter is None:
+            try:
+                return colour.convert(np.array((self.r, self.g, self.b)), "RGB", space)
+            except Exception:
+                raise AttributeError(name)
+        cache = self._cache
+        if space not in cache:
+            cache[space] = converter(self.r, self.g, self.b)
+        return cache[space]
 
     # === base hsv ===
     @property
     def hsv(self):
-        return tuple(map(float, colour.models.RGB_to_HSV(self._rgb)))
+        return self.__getattr__("hsv")
+
+    @property
+    def h(self):
+        return self.hsv[0]
+
+    @property
+    def s(self):
+        return self.hsv[1]
+
+    @property
+    def v(self):
+        return self.hsv[2]
+
+    @property
+    def oklch(self):
+        return self.__getattr__("oklch")
 
     @property
     def hex(self):
-        return colour.notation.RGB_to_HEX(self._rgb)
+        r, g, b = self.r, self.g, self.b
+        if 0 <= r <= 1 and 0 <= g <= 1 and 0 <= b <= 1:
+            return f"#{int(r * 255):02x}{int(g * 255):02x}{int(b * 255):02x}"
+        # out of gamut (e.g. from OKLCH), colour clips and renormalises these
+        return str(colour.notation.RGB_to_HEX((r, g, b)))
 
     @property
     def rgb(self):
-        return (self._rgb * 255).astype(int).tolist()
+        return [int(self.r * 255), int(self.g * 255), int(self.b * 255)]
 
     # === constructors ===
     @classmethod
     def from_rgb(cls, r, g, b):
-        obj = cls.__new__(cls)
-        obj._rgb = np.array([r, g, b], float) / 255
-        return obj
+        return cls._from_unit_rgb(_rgb255_to_rgb(r, g, b))
 
     @classmethod
     def from_hex(cls, hex_color):
-        obj = cls.__new__(cls)
-        obj._rgb = np.array(colour.notation.HEX_to_RGB(hex_color))
-        return obj
+        return cls._from_unit_rgb(_hex_to_rgb(hex_color))
 
     @classmethod
     def from_oklch(cls, l, c, h):
-        obj = cls.__new__(cls)
-        obj._rgb = np.array(colour.convert([l, c, h], "OKLCH", "RGB"))
-        return obj
+        return cls._from_unit_rgb(_oklch_to_rgb(l, c, h))
 
     # === oklch operations ===
     def set_lightness(self, l):
@@ -90,14 +273,40 @@ class Color:
     def complementary(self):
         return self.hue_shift(0.5)
 
+    # the *_all forms return every variant of a harmony in one go, the indexed
+    # forms pick one of them (wrapping around)
+    def analogous_all(self) -> tuple[Self, ...]:
+        return tuple(self.hue_shifts(_HUE_HARMONIES["Analogous"]))
+
+    def triadic_all(self) -> tuple[Self, ...]:
+        return tuple(self.hue_shifts(_HUE_HARMONIES["Triadic"]))
+
+    def tetradic_all(self) -> tuple[Self, ...]:
+        return tuple(self.hue_shifts(_HUE_HARMONIES["Tetradic"]))
+
     def analogous(self, index=0):
-        return self.hue_shifts([-1 / 12, 1 / 12])[index % 2]
+        variants = self.analogous_all()
+        return variants[index % len(variants)]
 
     def triadic(self, index=0):
-        return self.hue_shifts([1 / 3, 2 / 3])[index % 2]
+        variants = self.triadic_all()
+        return variants[index % len(variants)]
 
     def tetradic(self, index=0):
-        return self.hue_shifts([0.25, 0.5, 0.75])[index % 3]
+        variants = self.tetradic_all()
+        return variants[index % len(variants)]
+
+    def harmonies(self) -> dict[str, list[Self]]:
+        """Every hue harmony plus the tint and shade ramps of this color."""
+        variants = {
+            "Complementary": [self.complementary()],
+            "Analogous": list(self.analogous_all()),
+            "Triadic": list(self.triadic_all()),
+            "Tetradic": list(self.tetradic_all()),
+        }
+        variants["Tints"] = [self.tint(t) for t in _HARMONY_RAMP]
+        variants["Shades"] = [self.shade(t) for t in _HARMONY_RAMP]
+        return variants
 
     def tint(self, t):
         hh, ss, vv = self.hsv
@@ -114,3 +323,71 @@ class Color:
         return Color(
             (sh + delta * pos) % 1.0, ss + (ts - ss) * pos, sv + (tv - sv) * pos
         )
+
+
+class ColorArray:
+    """A batch of colors held as a (..., 3) HSV array."""
+
+    __slots__ = ("hsv",)
+
+    def __init__(self, hsv):
+        self.hsv = np.asarray(hsv, float)
+
+    @classmethod
+    def from_colors(cls, colors):
+        return cls([color.hsv for color in colors])
+
+    def __len__(self):
+        return len(self.hsv)
+
+    def __getitem__(self, index):
+        return ColorArray(self.hsv[index])
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    @property
+    def rgb(self):
+        return Color.hsv_to_rgb_batch(self.hsv)
+
+    def tolist(self):
+        """Nested lists of Color objects mirroring the array shape."""
+        rgbs = self.rgb.reshape(-1, 3) * 255
+        colors = np.empty(len(rgbs), object)
+        for i, rgb in enumerate(rgbs):
+            colors[i] = Color.from_rgb(*rgb)
+        return colors.reshape(self.hsv.shape[:-1]).tolist()
+
+    # === hsv-style ops, array arguments add a trailing axis ===
+    def _split(self, t):
+        t = np.asarray(t, float)
+        hsv = self.hsv.reshape(self.hsv.shape[:-1] + (1,) * t.ndim + (3,))
+        return hsv[..., 0], hsv[..., 1], hsv[..., 2], t
+
+    @staticmethod
+    def _stack(h, s, v):
+        return ColorArray(np.stack(np.broadcast_arrays(h, s, v), -1))
+
+    def hue_shift(self, delta):
+        hh, ss, vv, delta = self._split(delta)
+        return self._stack((hh + delta) % 1.0, ss, vv)
+
+    def hue_shifts(self, deltas):
+        return self.hue_shift(np.asarray(deltas, float))
+
+    def tint(self, t):
+        hh, ss, vv, t = self._split(t)
+        return self._stack(hh, ss + (1 - ss) * t, vv + (1 - vv) * t)
+
+    def shade(self, t):
+        hh, ss, vv, t = self._split(t)
+        return self._stack(hh, ss, vv * (1 - t))
+
+    def harmonies(self) -> dict[str, Self]:
+        """Color.harmonies for every color at once, each variant on a new axis."""
+        variants = {
+            name: self.hue_shifts(deltas) for name, deltas in _HUE_HARMONIES.items()
+        }
+        variants["Tints"] = self.tint(_HARMONY_RAMP)
+        variants["Shades"] = self.shade(_HARMONY_RAMP)
+        return variants
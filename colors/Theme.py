@@ -1,8 +1,18 @@
 import re
-from typing import Callable
 from colors.Color import Color
 
 
+def parse_nums(s: str) -> list[float]:
+    # integers stay ints so they can index ANALOGOUS(1) and friends
+    return [
+        int(x) if x.strip().isdigit() else float(x) for x in s.split(",") if x.strip()
+    ]
+
+
+def rgb_text(color: Color) -> str:
+    return str(color.rgb).strip("[]")
+
+
 class Theme:
 
     def __init__(
@@ -12,9 +22,35 @@ class Theme:
         self.roles = {k: Color.from_hex(v) for k, v in color_roles.items()}
         self.variables = variables
 
+        # Everything that only depends on the theme is prepared here once and
+        # reused by every template rendered with it
+        references = {f"KEY({i})": rgb_text(c) for i, c in self.keys.items()}
+        references |= {f"ROLE({k})": rgb_text(c) for k, c in self.roles.items()}
+
+        def resolve(text: str) -> str:
+            return self._REFERENCES.sub(
+                lambda m: references.get(m.group(0), m.group(0)), text
+            )
+
+        # VAR.REPLACE, ROLE(name) and KEY(n) all become a table lookup in a single
+        # pass; variable values may themselves use ROLE/KEY, so resolve them now
+        self._substitutions = {
+            f"{k.upper()}.REPLACE": resolve(v) for k, v in variables.items()
+        } | references
+        self._substitution_pattern = re.compile(
+            "|".join(
+                [
+                    re.escape(token)
+                    for token in self._substitutions
+                    if "REPLACE" in token
+                ]
+                + [self._REFERENCES.pattern]
+            )
+        )
+
     FUNCTIONS = {
         "HUE_SHIFT": Color.hue_shift,
-        "LERP": Color.lerp,
+        "LERP": lambda c, r, g, b, pos: c.lerp_target(Color.from_rgb(r, g, b), pos),
         "TINT": Color.tint,
         "SHADE": Color.shade,
         "COMPLEMENTARY": Color.complementary,
@@ -30,55 +66,37 @@ class Theme:
         "HEX": Color.hex,
     }
 
-    def process_template(self, template: str) -> str:
-
-        def parse_nums(s: str) -> list[float]:
-            return [float(x) for x in s.split(",") if x.strip()]
-
-        def lam(func):
-            return lambda m: str(
-                func(
-                    Color.from_rgb(*parse_nums(m.group(1))), *parse_nums(m.group(2))
-                ).rgb
-            ).strip("[]")
+    # every operator in one alternation, so a pass scans the template once
+    _OPERATORS = re.compile(
+        r"(?P<rgb>\d+,\s*\d+,\s*\d+)\.(?:"
+        rf"(?P<func>{'|'.join(FUNCTIONS)})\((?P<args>.*?)\)"
+        rf"|(?P<prop>{'|'.join(PROPERTIES)})\b)"
+    )
+    # cheap literal scan for any operator name, most config text has none
+    _OPERATOR_NAMES = re.compile(rf"\.(?:{'|'.join([*FUNCTIONS, *PROPERTIES])})\b")
+    # ROLE(name) / KEY(n) never nest, a single pass resolves all of them
+    _REFERENCES = re.compile(r"ROLE\((?P<role>\w+)\)|KEY\((?P<key>\d+)\)")
+
+    def _apply(self, m: re.Match) -> str:
+        color = Color.from_rgb(*parse_nums(m.group("rgb")))
+        if m.group("prop"):
+            prop = self.PROPERTIES[m.group("prop")]
+            return getattr(color, prop.fget.__name__)
+        func = self.FUNCTIONS[m.group("func")]
+        return rgb_text(func(color, *parse_nums(m.group("args"))))
 
-        def prop(pr):
-            return lambda m: getattr(
-                Color.from_rgb(*parse_nums(m.group(1))), pr.fget.__name__
-            )
-
-        match_to_func: dict[re.Pattern, Callable] = {}
-
-        for name, f in self.FUNCTIONS.items():
-            pattern = rf"(\d+,\s*\d+,\s*\d+)\.{name}\((.*?)\)"
-            match_to_func[re.compile(pattern)] = lam(f)
-
-        for name, f in self.PROPERTIES.items():
-            pattern = rf"(\d+,\s*\d+,\s*\d+)\.{name}\b"
-            match_to_func[re.compile(pattern)] = prop(f)
-
-        # KEY(n)
-        def handle_key(m):
-            col = self.keys.get(int(m.group(1)))
-            return str(col.rgb).strip("[]") if col else m.group(0)
-
-        # ROLE(name)
-        def handle_role(m):
-            col = self.roles.get(m.group(1))
-            return str(col.rgb).strip("[]") if col else m.group(0)
-
-        match_to_func[re.compile(r"ROLE\((\w+)\)")] = handle_role
-        match_to_func[re.compile(r"KEY\((\d+)\)")] = handle_key
-
-        for k, v in self.variables.items():
-            template = re.sub(k.upper() + r"\.REPLACE", v, template)
-        changed = True
-        while changed:
-            changed = False
-            for pattern, f in match_to_func.items():
-                new_t = pattern.sub(f, template)
-                if new_t != template:
-                    changed = True
-                    template = new_t
+    def process_template(self, template: str) -> str:
+        template = self._substitution_pattern.sub(
+            lambda m: self._substitutions.get(m.group(0), m.group(0)), template
+        )
+
+        # plain references need no operator passes at all
+        if not self._OPERATOR_NAMES.search(template):
+            return template
+
+        # each substitution consumes one operator, so this stops once none match
+        count = 1
+        while count:
+            template, count = self._OPERATORS.subn(self._apply, template)
 
         return template
@@ -0,0 +1,166 @@
+from functools import lru_cache
+
+import numpy as np
+
+# points per assignment tile; 4096 float32 RGB rows stay cache resident and the
+# inputs large enough for the kernel split into enough tiles for every core
+TILE = 1 << 12
+# below this many points sklearn's Elkan finishes before numba has even loaded
+# its cached kernel; the <=32768 histogram bins of a palette never reach it
+NUMBA_MIN_POINTS = 1 << 19
+
+
+def kmeans(points, weights, n_clusters, max_iter=100, seed=42, use_gpu=False, n_init=1):
+    """Weighted k-means on (N, 3) points, returns (centers, labels).
+
+    With use_gpu the Lloyd iterations run through CuPy when it is installed,
+    otherwise sklearn runs them, or the Numba kernel for NUMBA_MIN_POINTS or
+    more points. n_init > 1 reruns from fresh seeds and keeps the run with the
+    lowest weighted inertia.
+    """
+    # float32 is plenty for 0-255 channels and halves the bytes moved per pass
+    # compared to the float64 that sklearn would otherwise upcast to
+    points = np.ascontiguousarray(points, np.float32)
+    weights = np.asarray(weights, np.float32)
+    best, best_inertia = None, np.inf
+    for run in range(n_init):
+        centers, labels = _kmeans_once(
+            points, weights, n_clusters, max_iter, seed + run, use_gpu
+        )
+        if n_init == 1:
+            return centers, labels
+        inertia = ((points - centers[labels]) ** 2).sum(axis=1) @ weights
+        if inertia < best_inertia:
+            best, best_inertia = (centers, labels), inertia
+    return best
+
+
+def _kmeans_once(points, weights, n_clusters, max_iter, seed, use_gpu):
+    # sklearn is only needed once we actually cluster, keep it off CLI startup
+    from sklearn.cluster import kmeans_plusplus
+
+    # a single k-means++ pass seeds whichever backend refines the centers
+    seeds, _ = kmeans_plusplus(
+        points, n_clusters, sample_weight=weights, random_state=seed
+    )
+    if use_gpu:
+        try:
+            return _kmeans_gpu(points, weights, seeds, max_iter)
+        except ImportError:
+            pass
+    kernel = _numba_kernel() if len(points) >= NUMBA_MIN_POINTS else None
+    if kernel is None:
+        return _kmeans_sklearn(points, weights, seeds, max_iter, seed)
+    return kernel(points, weights.astype(np.float64), seeds, max_iter)
+
+
+def limit_threads(n):
+    """Cap the number of threads the k-means kernel uses in this process."""
+    try:
+        from numba import set_num_threads
+    except ImportError:
+        return
+    set_num_threads(n)
+
+
+def _kmeans_gpu(points, weights, seeds, max_iter):
+    import cupy as cp
+
+    d_points = cp.asarray(points)
+    d_weights = cp.asarray(weights, cp.float64)
+    centers = cp.asarray(seeds)
+    k = len(seeds)
+    labels = None
+    for _ in range(max_iter):
+        # one thread per (point, center) pair, then an argmin over the k centers
+        distances = ((d_points[:, None, :] - centers[None, :, :]) ** 2).sum(-1)
+        new_labels = distances.argmin(1)
+        if labels is not None and bool((new_labels == labels).all()):
+            break
+        labels = new_labels
+        totals = cp.bincount(labels, weights=d_weights, minlength=k)
+        sums = cp.stack(
+            [
+                cp.bincount(labels, weights=d_points[:, c] * d_weights, minlength=k)
+                for c in range(3)
+            ],
+            1,
+        )
+        filled = totals > 0
+        centers[filled] = (sums[filled] / totals[filled, None]).astype(centers.dtype)
+    return cp.asnumpy(centers), cp.asnumpy(labels)
+
+
+def _kmeans_sklearn(points, weights, seeds, max_iter, seed):
+    from sklearn.cluster import KMeans
+
+    # The histogram keeps the input to at most 32768 points, so full-batch
+    # Elkan is affordable and its triangle-inequality bounds skip most of the
+    # point-center distances for well separated RGB clusters
+    model = KMeans(
+        n_clusters=len(seeds),
+        init=seeds,
+        n_init=1,
+        max_iter=max_iter,
+        algorithm="elkan",
+        random_state=seed,
+    )
+    model.fit(points, sample_weight=weights)
+    return model.cluster_centers_, model.labels_
+
+
+@lru_cache(maxsize=None)
+def _numba_kernel():
+    """The compiled k-means kernel, or None without Numba.
+
+    Importing numba costs more than the rest of the CLI startup combined, so it
+    only happens on the first clustering run.
+    """
+    try:
+        from numba import njit, prange
+    except ImportError:
+        return None
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def kmeans_small(points, weights, seeds, max_iter):
+        n = points.shape[0]
+        k = seeds.shape[0]
+        centers = seeds.copy()
+        labels = np.full(n, -1, np.int64)
+        n_tiles = (n + TILE - 1) // TILE
+        for _ in range(max_iter):
+            # per-tile (sum_r, sum_g, sum_b, weight) so threads never share a row
+            partial = np.zeros((n_tiles, k, 4))
+            changed = np.zeros(n_tiles, np.int64)
+            for t in prange(n_tiles):
+                for i in range(t * TILE, min((t + 1) * TILE, n)):
+                    r, g, b = points[i, 0], points[i, 1], points[i, 2]
+                    best = 0
+                    best_dist = np.float32(0.0)
+                    for j in range(k):
+                        dr = r - centers[j, 0]
+                        dg = g - centers[j, 1]
+                        db = b - centers[j, 2]
+                        dist = dr * dr + dg * dg + db * db
+                        if j == 0 or dist < best_dist:
+                            best = j
+                            best_dist = dist
+                    if labels[i] != best:
+                        labels[i] = best
+                        changed[t] += 1
+                    w = weights[i]
+                    partial[t, best, 0] += w * r
+                    partial[t, best, 1] += w * g
+                    partial[t, best, 2] += w * b
+                    partial[t, best, 3] += w
+            if changed.sum() == 0:
+                break
+            sums = partial.sum(axis=0)
+            for j in range(k):
+                if sums[j, 3] > 0:
+                    centers[j, 0] = sums[j, 0] / sums[j, 3]
+                    centers[j, 1] = sums[j, 1] / sums[j, 3]
+                    centers[j, 2] = sums[j, 2] / sums[j, 3]
+        return centers, labels
+
+    return kmeans_small
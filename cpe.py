@@ -5,163 +5,254 @@
 Color Palette Extractor
 """
 import json
+import os
+from collections import namedtuple
+from functools import lru_cache, partial
+from multiprocessing import Pool
 from pathlib import Path
 
+# Each palette is far too small to gain from BLAS/OpenMP threads, and batches
+# run one image per process, so this has to be set before sklearn gets imported
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+
 import click
 import numpy as np
-from PIL import Image, ImageFont, ImageDraw, ImageChops, ImageOps
-from sklearn.cluster import KMeans
+from PIL import Image, ImageFont, ImageDraw
 
-from colors.Color import Color, ColorEncoder
+from colors.Color import Color, ColorArray, ColorEncoder
+from colors.cluster import kmeans
 from colors.roles import get_roles
 
+# What the renderers need of a color, formatted once when the palette is built
+PaletteRow = namedtuple("PaletteRow", "hex rgb role")
+
+
+def palette_row(color, role=None):
+    return PaletteRow(color.hex, tuple(color.rgb), role)
+
 
-def extract_color_palette(image_path, num_colors):
-    """Extract a color palette from an image using KMeans clustering."""
+def load_image(image_path, max_dimension=1000):
+    """Decode an image as RGB, at most max_dimension pixels on its longer side."""
     img = Image.open(image_path)
 
-    # Calculate new dimensions
-    max_dimension = 1000  # Maximum dimension for processing
-    width, height = img.size
-    if max(width, height) > max_dimension:
-        scale_factor = max_dimension / max(width, height)
-        new_width = int(width * scale_factor)
-        new_height = int(height * scale_factor)
-        img = img.resize((new_width, new_height), Image.LANCZOS)
+    # Downscale while decoding where the format supports it (JPEG), then in place.
+    # BOX averages each source area, which is cheaper than LANCZOS and keeps the
+    # color frequencies the clustering cares about instead of sharpening edges
+    img.draft("RGB", (max_dimension, max_dimension))
+    img.thumbnail((max_dimension, max_dimension), Image.BOX)
 
     # Convert image to RGB mode if it's not already
     if img.mode != "RGB":
         img = img.convert("RGB")
-
-    img_array = np.array(img)
-
-    # Reshape to a list of pixels
-    img_pixels = img_array.reshape((-1, 3))
-
-    # Apply KMeans clustering
-    kmeans = KMeans(n_clusters=num_colors, n_init=10, random_state=42)
-    kmeans.fit(img_pixels)
+    return img
+
+
+def extract_color_palette(image, num_colors, use_gpu=False, n_init=1):
+    """Extract a color palette from an image path or a load_image result.
+
+    k-means++ seeding makes one clustering run enough for a palette, n_init
+    reruns it from other seeds and keeps the tightest result.
+    """
+    img = image if isinstance(image, Image.Image) else load_image(image)
+
+    # View the decoded bytes as a list of uint8 pixels, only the bins get widened
+    img_pixels = np.frombuffer(img.tobytes(), np.uint8).reshape((-1, 3))
+
+    # Quantize to a 5-bit-per-channel histogram so KMeans only sees occupied bins
+    codes = img_pixels.astype(np.uint32) >> 3
+    bins = (codes[:, 0] << 10) | (codes[:, 1] << 5) | codes[:, 2]
+    bin_counts = np.bincount(bins, minlength=32768)
+    occupied = np.nonzero(bin_counts)[0]
+    channels = [(occupied >> shift) & 31 for shift in (10, 5, 0)]
+    bin_centers = np.stack(channels, 1).astype(np.float32) * 8 + 4
+    weights = bin_counts[occupied]
+
+    # Apply weighted k-means, each bin counting as many pixels as it holds
+    cluster_centers, labels = kmeans(
+        bin_centers,
+        weights,
+        min(num_colors, len(occupied)),
+        use_gpu=use_gpu,
+        n_init=n_init,
+    )
 
     # Extract Info
-    labels, counts = np.unique(kmeans.labels_, return_counts=True)
+    counts = np.bincount(labels, weights=weights, minlength=len(cluster_centers))
     sorted_indices = np.argsort(-counts)  # Descending order of population
 
     color_palette = {"Colors": []}
     for rank, idx in enumerate(sorted_indices):
-        color = Color.from_rgb(*kmeans.cluster_centers_[idx].astype(int))
+        color = Color.from_rgb(*cluster_centers[idx].astype(int))
         color_palette["Colors"].append(color)
-    color_palette["Roles"] = get_roles(img_array, kmeans, color_palette["Colors"])
+    color_palette["Roles"] = get_roles(cluster_centers, counts)
+    # one row per entry of Colors and of Roles, in the same order
+    color_palette["Rows"] = {
+        "Colors": [palette_row(color) for color in color_palette["Colors"]],
+        "Roles": [
+            palette_row(color, role) for role, color in color_palette["Roles"].items()
+        ],
+    }
 
     return color_palette
 
 
-def get_harmonies(color_palette):
-    """Generate common color harmonies based on the palette."""
-    harmonies = {}
-    for color in color_palette:
-        harmony = {
-            "Complementary": [color.complementary(i) for i in range(1)],
-            "Analogous": [color.analogous(i) for i in range(2)],
-            "Triadic": [color.triadic(i) for i in range(2)],
-            "Tetradic": [color.tetradic(i) for i in range(3)],
-            "Tints": [color.tint(i / 5) for i in range(1, 5)],
-            "Shades": [color.shade(i / 5) for i in range(1, 5)],
-        }
-        harmonies[color] = harmony
-    return harmonies
+def _extract_one(image_path, num_colors):
+    return image_path, extract_color_palette(image_path, num_colors)
+
+
+def batch_extract(paths, num_colors, workers=None):
+    """Extract palettes for many images in parallel, keyed by path."""
+    # palette histograms stay below cluster.NUMBA_MIN_POINTS, so workers only
+    # run sklearn, which OMP_NUM_THREADS already keeps single threaded
+    with Pool(workers) as pool:
+        return dict(
+            pool.imap_unordered(partial(_extract_one, num_colors=num_colors), paths)
+        )
+
+
+def get_harmonies(colors, rows):
+    """Generate common color harmonies, as (row, harmonies) pairs in palette order.
+
+    rows are the palette rows built from colors, one per color. Pairs rather
+    than a dict keep clusters that format to the same hex apart.
+    """
+    variants = ColorArray.from_colors(colors).harmonies()
+    blocks = {
+        name: [[palette_row(c) for c in shifted] for shifted in block.tolist()]
+        for name, block in variants.items()
+    }
+    return [
+        (row, {name: blocks[name][n] for name in blocks})
+        for n, row in enumerate(rows)
+    ]
+
+
+@lru_cache(maxsize=None)
+def default_font():
+    return ImageFont.load_default()
 
 
 def save_palette_to_png(
-    color_palette, harmonies, output_file="color_palette.png", image_file=""
+    color_palette,
+    harmonies,
+    output_file="color_palette.png",
+    base_img=None,
+    image_file="",
 ):
-    # Load base image
-    base_img = Image.open(image_file).resize((300, 200))
-    font = ImageFont.load_default()
-
-    # Create blank canvas
-    width = 1000
-    height = 600 + 500 * len(harmonies)
-    out_img = Image.new("RGB", (width, height), "white")
-    draw = ImageDraw.Draw(out_img)
+    # Reuse the already decoded image if the caller has one
+    if base_img is None:
+        base_img = Image.open(image_file).convert("RGB")
+    base_img = base_img.resize((300, 200))
+    font = default_font()
+
+    # One row per base color: the color itself followed by all of its harmonies
+    rows = {
+        name: [
+            [color] + [c for colors in harmony.values() for c in colors]
+            for color, harmony in harmony_sets
+        ]
+        for name, harmony_sets in harmonies.items()
+    }
+    palette = color_palette["Rows"]["Colors"]
+    longest = max(
+        [len(palette)] + [len(row) for section in rows.values() for row in section]
+    )
+
+    # Create blank canvas, swatches are filled directly into the array
+    width = 40 + 60 * longest
+    height = 400 + sum(30 + 80 * len(section) for section in rows.values())
+    canvas = np.full((height, width, 3), 255, np.uint8)
+    labels = []
+    max_x, max_y = 320, 220  # bottom right corner of the pasted image
+
+    def swatch(x, y, color):
+        nonlocal max_x, max_y
+        canvas[y : y + 50, x : x + 50] = color.rgb
+        labels.append(((x, y + 55), color.hex))
+        max_x, max_y = max(max_x, x + 50), max(max_y, y + 50)
 
     # Paste original image
-    out_img.paste(base_img, (20, 20))
+    canvas[20:220, 20:320] = np.asarray(base_img)
 
     # Draw palette
-    draw.text((20, 240), "Original Palette:", font=font, fill="black")
-    for i, (hex_color, _, _) in enumerate(color_palette):
-        x = 20 + i * 60
-        draw.rectangle([x, 270, x + 50, 320], fill=hex_color)
-        draw.text((x, 325), hex_color, font=font, fill="black")
+    labels.append(((20, 240), "Original Palette:"))
+    for i, color in enumerate(palette):
+        swatch(20 + i * 60, 270, color)
 
     # Draw harmonies
     y_start = 370
-    for name, harmony_sets in harmonies.items():
-        draw.text((20, y_start), f"{name} Harmony:", font=font, fill="black")
+    for name, section in rows.items():
+        labels.append(((20, y_start), f"{name} Harmony:"))
         y_start += 30
-        for hset in harmony_sets:
-            for i, hex_color in enumerate(hset.values()):
-                x = 20 + i * 60
-                draw.rectangle([x, y_start, x + 50, y_start + 50], fill=hex_color)
-                draw.text((x, y_start + 55), hex_color, font=font, fill="black")
+        for row in section:
+            for i, color in enumerate(row):
+                swatch(20 + i * 60, y_start, color)
             y_start += 80
 
-    bg = Image.new(out_img.mode, out_img.size, "white")
-    diff = ImageChops.difference(out_img, bg)
-    bbox = diff.getbbox()
-    if bbox:
-        out_img = out_img.crop(bbox)
-        out_img = ImageOps.expand(out_img, border=20, fill="white")
+    # Text is the only part that still needs PIL
+    out_img = Image.fromarray(canvas)
+    draw = ImageDraw.Draw(out_img)
+    for position, text in labels:
+        draw.text(position, text, font=font, fill="black")
+        _, _, right, bottom = draw.textbbox(position, text, font=font)
+        max_x, max_y = max(max_x, right), max(max_y, bottom)
 
-    out_img.save(output_file)
+    # Everything starts at (20, 20), so keep the same margin on the far side
+    out_img.crop((0, 0, max_x + 20, max_y + 20)).save(output_file)
+
+
+def rgb_to_cmyk_array(rgb):
+    """Convert an (N, 3) array of 0-255 RGB values to (N, 4) CMYK percentages."""
+    cmy = 1.0 - np.asarray(rgb, np.float32) / 255.0
+    k = cmy.min(axis=1, keepdims=True)
+    cmy = (cmy - k) / np.where(k < 1, 1 - k, 1)
+    return np.round(np.concatenate([cmy, k], axis=1) * 100).astype(int)
 
 
 def save_palette_and_harmonies(color_palette, harmonies, filename="color_info"):
     """Save the color palette and harmonies to a text file."""
+    palette = color_palette["Rows"]["Colors"]
+    cmyks = rgb_to_cmyk_array([row.rgb for row in palette]).tolist()
     with open(filename + ".txt", "w") as f:
         f.write("Color Palette:\n")
-        for color in color_palette:
-            f.write(f"HEX: {color[0]}, RGB: {color[1]}\n")
+        for row, cmyk in zip(palette, cmyks):
+            f.write(f"HEX: {row.hex}, RGB: {row.rgb}, CMYK: {tuple(cmyk)}\n")
 
         f.write("\nColor Harmonies:\n")
-        for color, harmony in harmonies["Colors"].items():
-            f.write(f"{color}\n")
+        for color, harmony in harmonies["Colors"]:
+            f.write(f"{color.hex}\n")
             for harmony_type, colors in harmony.items():
                 f.write(f"\n{harmony_type}:\n")
-                if not isinstance(colors, list):
-                    colors = [colors]
-                for c in colors:
-                    f.write(f"{c.hex} ")
+                f.write("".join(f"{c.hex} " for c in colors))
                 f.write("\n")
-    # Save the data to a JSON file
+    # Save the data to a JSON file, the rows are derived from it
     with open(filename + ".json", "w") as f:
-        json.dump(color_palette, f, indent=4, cls=ColorEncoder)
+        colors = {key: color_palette[key] for key in ("Colors", "Roles")}
+        json.dump(colors, f, indent=4, cls=ColorEncoder)
 
 
 def print_palette_terminal(color_palette, harmonies):
-    def color_block(color):
-        if isinstance(color, str):
-            color = Color.from_hex(color)
+    def swatch(color):
         r, g, b = color.rgb
-        return f"\033[48;2;{r};{g};{b}m  \033[0m"
+        return f"\033[48;2;{r};{g};{b}m  \033[0m {color.hex}"
 
     print("\nOriginal Palette:")
-    for color in color_palette["Colors"]:
-        print(f"{color_block(color)} {color.hex}", end="  ")
+    for row in color_palette["Rows"]["Colors"]:
+        print(swatch(row), end="  ")
     print("\n")
 
-    for role, color in color_palette["Roles"].items():
-        print(f"{role.title()} {color_block(color)} {color.hex}")
+    for row in color_palette["Rows"]["Roles"]:
+        print(f"{row.role.title()} {swatch(row)}")
 
     for section, harmony_section in harmonies.items():
-        for name, harmony_sets in harmony_section.items():
-            print(f"{color_block(name)} {name.hex} Harmony:")
+        for name, harmony_sets in harmony_section:
+            print(f"{swatch(name)} Harmony:")
             for hname, hset in harmony_sets.items():
                 print(f"{hname:<20}", end="")
                 if not isinstance(hset, list):
                     hset = [hset]
                 for color in hset:
-                    print(f"{color_block(color)} {color.hex}", end="\t")
+                    print(swatch(color), end="\t")
                 print()
             print()
 
@@ -180,19 +271,35 @@ def print_palette_terminal(color_palette, harmonies):
     default=False,
     help="Render to reference PNG (default is False)",
 )
+@click.option(
+    "--gpu",
+    is_flag=True,
+    default=False,
+    help="Run the clustering on the GPU when CuPy is installed",
+)
+@click.option(
+    "--quality",
+    is_flag=True,
+    default=False,
+    help="Keep the best of 10 clustering runs instead of a single one",
+)
 @click.option("-q", is_flag=True, default=False, help="Quiet")
-def main(file, number, png, q, output):
+def main(file, number, png, gpu, quality, q, output):
     """Main function to run the color palette and harmony generator."""
 
-    color_palette = extract_color_palette(file, number)
+    img = load_image(file)
+    color_palette = extract_color_palette(
+        img, number, use_gpu=gpu, n_init=10 if quality else 1
+    )
     output = output if output else Path("~/.cache/cpe").expanduser().as_posix()
+    rows = color_palette["Rows"]
     harmonies = {
-        "Colors": get_harmonies(color_palette["Colors"]),
-        "Roles": get_harmonies(color_palette["Roles"].values()),
+        "Colors": get_harmonies(color_palette["Colors"], rows["Colors"]),
+        "Roles": get_harmonies(color_palette["Roles"].values(), rows["Roles"]),
     }
     save_palette_and_harmonies(color_palette, harmonies, output + "/colors")
     if png:
-        save_palette_to_png(color_palette, harmonies, image_file=file)
+        save_palette_to_png(color_palette, harmonies, base_img=img)
     if not q:
         print_palette_terminal(color_palette, harmonies)
 
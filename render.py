@@ -1,6 +1,7 @@
 import json
 import os
 import time
+from multiprocessing import Pool
 from pathlib import Path
 
 import click
@@ -19,6 +20,18 @@ def process_file(theme: Theme, input_file, output_file):
     #  print(f"Processed: {input_file} -> {output_file}")
 
 
+_worker_theme: Theme | None = None
+
+
+def _init_worker(theme: Theme):
+    global _worker_theme
+    _worker_theme = theme
+
+
+def _process_job(input_file, output_file):
+    process_file(_worker_theme, input_file, output_file)
+
+
 @click.command()
 @click.option(
     "--input",
@@ -62,12 +75,16 @@ def main(input_path, colors, output, variables):
 
     # Check if input is a file or directory
     if os.path.isdir(input_path):
-        # If directory, process all files in the folder
-        for filename in os.listdir(input_path):
-            input_file = os.path.join(input_path, filename)
-            if os.path.isfile(input_file):
-                output_file = os.path.join(output, filename)
-                process_file(theme, input_file, output_file)
+        # If directory, process all files in the folder, spread over processes
+        # since every template renders independently; the theme is pickled once
+        # per worker and small files are handed out in chunks
+        jobs = [
+            (os.path.join(input_path, filename), os.path.join(output, filename))
+            for filename in os.listdir(input_path)
+            if os.path.isfile(os.path.join(input_path, filename))
+        ]
+        with Pool(initializer=_init_worker, initargs=(theme,)) as pool:
+            pool.starmap(_process_job, jobs, chunksize=16)
     else:
         # If single file, process the file
         output_file = os.path.join(output, os.path.basename(input_path))